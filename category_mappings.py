@@ -1,3 +1,10 @@
+import re
+from functools import lru_cache
+from itertools import chain
+from types import MappingProxyType
+
+__all__ = ['CATEGORY_GROUPS', 'QUERY_KEYWORDS', 'get_categories_for_query', 'get_all_categories']
+
 CATEGORY_GROUPS = {
     'power_platform': [
         'powerapps-overview', 'power-fx', 'maker', 'connect-data', 'transform-model',
@@ -155,28 +162,108 @@ QUERY_KEYWORDS = {
     'security': 'security_compliance'
 }
 
+# Plain single-word keywords are looked up as whole query tokens, so short
+# ones like 'rpa' or 'word' no longer fire inside 'corporate' or 'password'.
+# Multi-word keywords and ones with symbols go through the phrase scan below,
+# which also matches whole words only (allowing a plural 's'); just an edge
+# that is itself a symbol skips the boundary check, so '.net' matches inside
+# 'asp.net' and nothing is required after 'c#'.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_TOKEN_KEYWORDS = {k: group for k, group in QUERY_KEYWORDS.items() if k.isalnum()}
+_PHRASE_KEYWORDS = {k: group for k, group in QUERY_KEYWORDS.items() if not k.isalnum()}
+
+# Character trie of the phrase keywords; the empty key marks the end of a keyword.
+_TRIE = {}
+for _keyword in _PHRASE_KEYWORDS:
+    _node = _TRIE
+    for _char in _keyword:
+        _node = _node.setdefault(_char, {})
+    _node[""] = True
+del _keyword, _node, _char
+
+def _trie_pattern(node, last_char=""):
+    """Render a trie node as a regex that matches the longest keyword below it.
+    
+    A keyword ending with a letter or digit must end on a word edge, optionally
+    after a plural 's' as with single-word keywords.
+    """
+    branches = [re.escape(char) + _trie_pattern(child, char) for char, child in sorted(node.items()) if char]
+    if "" in node:
+        # Ending here is tried last, so longer keywords win
+        branches.append("(?=s?(?![a-z0-9]))" if last_char.isalnum() else "")
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+# Every phrase occurrence (overlapping ones included) is found in a single
+# scan. The pattern follows the trie, so at each position the engine descends
+# one character at a time instead of retrying every keyword. Keywords starting
+# with a letter or digit share one lookbehind for their leading word edge.
+_PHRASE_BRANCHES = []
+_ALNUM_TRIE = {char: child for char, child in _TRIE.items() if char.isalnum()}
+_OTHER_TRIE = {char: child for char, child in _TRIE.items() if not char.isalnum()}
+if _ALNUM_TRIE:
+    _PHRASE_BRANCHES.append("(?<![a-z0-9])" + _trie_pattern(_ALNUM_TRIE))
+if _OTHER_TRIE:
+    _PHRASE_BRANCHES.append(_trie_pattern(_OTHER_TRIE))
+_PHRASE_PATTERN = re.compile("(?=(" + "|".join(_PHRASE_BRANCHES) + "))")
+del _PHRASE_BRANCHES, _ALNUM_TRIE, _OTHER_TRIE
+
+def _ends_at_word_edge(keyword, phrase):
+    """Whether keyword, as a prefix of phrase, ends on a word boundary (or plural 's') within it."""
+    rest = phrase[len(keyword):]
+    if not rest or not keyword[-1].isalnum():
+        return True
+    if rest[0] == 's':
+        rest = rest[1:]
+    return not rest or not rest[0].isalnum()
+
+# Only the longest phrase is reported per position, so each phrase also
+# carries the groups of any shorter phrase that is a whole-word prefix of it.
+_PHRASE_GROUPS = {
+    phrase: frozenset(
+        group for k, group in _PHRASE_KEYWORDS.items()
+        if phrase.startswith(k) and _ends_at_word_edge(k, phrase)
+    )
+    for phrase in _PHRASE_KEYWORDS
+}
+
+# Deduplicated categories per group and overall, built once in declaration order
+_GROUP_CATS = {group: tuple(dict.fromkeys(categories)) for group, categories in CATEGORY_GROUPS.items()}
+_ALL_CATEGORIES = tuple(dict.fromkeys(chain.from_iterable(_GROUP_CATS.values())))
+
+# The lookup tables above are derived once from these mappings, so callers get
+# read-only views with tuple values; changing them at runtime would silently
+# desync routing
+CATEGORY_GROUPS = MappingProxyType({group: tuple(categories) for group, categories in CATEGORY_GROUPS.items()})
+QUERY_KEYWORDS = MappingProxyType(QUERY_KEYWORDS)
+
 def get_categories_for_query(query):
     """
     Get relevant category groups for a given query.
     Returns list of categories that might contain relevant documents.
     """
-    query_lower = query.lower()
+    return list(_categories_for_query(query.lower()))
+
+@lru_cache(maxsize=4096)
+def _categories_for_query(query_lower):
+    """Cached routing for a lowercased query; returns an immutable tuple."""
     relevant_groups = set()
     
-    for keyword, group in QUERY_KEYWORDS.items():
-        if keyword in query_lower:
-            relevant_groups.add(group)
+    for token in _TOKEN_PATTERN.findall(query_lower):
+        if token in _TOKEN_KEYWORDS:
+            relevant_groups.add(_TOKEN_KEYWORDS[token])
+        elif token.endswith('s') and token[:-1] in _TOKEN_KEYWORDS:
+            # Simple plurals such as 'flows', 'reports' or 'connectors'
+            relevant_groups.add(_TOKEN_KEYWORDS[token[:-1]])
+    
+    for phrase in _PHRASE_PATTERN.findall(query_lower):
+        relevant_groups.update(_PHRASE_GROUPS[phrase])
     
-    categories = []
-    for group in relevant_groups:
-        if group in CATEGORY_GROUPS:
-            categories.extend(CATEGORY_GROUPS[group])
+    categories = dict.fromkeys(chain.from_iterable(
+        cats for group, cats in _GROUP_CATS.items() if group in relevant_groups
+    ))
     
-    return list(set(categories))
+    return tuple(categories)
 
 def get_all_categories():
-    """Get all available categories."""
-    all_cats = []
-    for categories in CATEGORY_GROUPS.values():
-        all_cats.extend(categories)
-    return list(set(all_cats))
+    """Get all available categories as a tuple."""
+    return _ALL_CATEGORIES
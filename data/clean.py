@@ -1,7 +1,80 @@
 import sqlite3
 import re
-import json
-from typing import List, Dict, Any
+import hashlib
+from functools import lru_cache
+from multiprocessing import Pool
+from typing import List, Dict, Any, Optional
+
+import orjson
+
+# Statements used by clean_documents for every batch, defined once so each is
+# prepared once and then reused from the connection's statement cache
+_SQL_SELECT_BATCH = """SELECT id, url, title, content, word_count FROM documents
+                       WHERE id > ? AND content_type IS NOT 'cleaned'
+                       ORDER BY id LIMIT ?"""
+_SQL_UPDATE = """UPDATE documents
+                 SET content = ?, word_count = ?, content_hash = ?, content_type = 'cleaned'
+                 WHERE id = ?"""
+_SQL_MARK_CLEANED = "UPDATE documents SET content_type = 'cleaned' WHERE id = ?"
+_SQL_DELETE = "DELETE FROM documents WHERE id = ?"
+
+# Text normalisation patterns, compiled once at import
+# A whitespace run, plus a standalone letter and the whitespace after it if present
+_WHITESPACE_RE = re.compile(r'\s+(?:[a-zA-Z]\s+)?')
+_REPEATED_PUNCT_RE = re.compile(r'[.,;:!?]{2,}')
+_SYMBOL_LINE_RE = re.compile(r'^[^\w\s]*$', re.MULTILINE)
+# Punctuation with surrounding whitespace; group 2 is the whitespace after it,
+# unless that whitespace only leads up to more punctuation
+_PUNCT_SPACING_RE = re.compile(r'\s*([.,;:!?])(\s+(?![\s.,;:!?]))?')
+
+# Code block and result table patterns
+_PYTHON_SCALA_RE = re.compile(r'Python\s+(.+?)\s+Scala', re.DOTALL)
+_SCALA_RE = re.compile(r'Scala\s+(.+?)(?=\n\n|\Z)', re.DOTALL)
+_RESULT_TABLE_RE = re.compile(r'Result:\s*\+[-=+]+\+')
+_TABLE_BORDER_RE = re.compile(r'\+[-=+]*\+')
+
+_NUMBER_RE = re.compile(r'^\d+$')
+# Markers of code or technical content: code keywords are matched as written,
+# technical terms against the lowercased content
+_CODE_MARKERS = ('def ', 'class ', 'import ', 'SELECT', 'FROM', 'public ', 'private ')
+_TECHNICAL_TERMS = ('example', 'code', 'syntax', 'parameter')
+
+def _punct_spacing(match):
+    """Drop whitespace before punctuation and keep a single space after it."""
+    return match.group(1) + ' ' if match.group(2) else match.group(1)
+
+# Compiled per distinct pattern list, so edits to a cleaner's removal_patterns
+# after construction take effect on its next clean_text call
+@lru_cache(maxsize=32)
+def _removal_regex(patterns: tuple):
+    """Fuse the removal patterns into one alternation, so the text is scanned once."""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE | re.MULTILINE)
+
+# Compiled per distinct indicator list, for the same reason as _removal_regex
+@lru_cache(maxsize=32)
+def _indicator_regex(indicators: tuple):
+    """Alternation of the lowercased indicators, searched once per lowercased paragraph."""
+    return re.compile('|'.join(re.escape(indicator.lower()) for indicator in indicators))
+
+_SENTENCE_END_RE = re.compile(r'[.!?]+')
+
+def _has_meaningful_sentences(content: str, required: int) -> bool:
+    """Check for `required` sentences over 20 characters, stopping as soon as they are found."""
+    found = 0
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(content):
+        # Only segments that are long enough before stripping get sliced
+        end = match.start()
+        if end - start > 20 and len(content[start:end].strip()) > 20:
+            found += 1
+            if found >= required:
+                return True
+        start = match.end()
+    
+    # The text after the last delimiter is a sentence too
+    if len(content) - start > 20 and len(content[start:].strip()) > 20:
+        found += 1
+    return found >= required
 
 class DocumentCleaner:
     def __init__(self, db_path: str = "microsoft_docs.db"):
@@ -39,9 +112,10 @@ class DocumentCleaner:
             r'\d{2}/\d{2}/\d{4}\s*',
             r'File metadata column\s*',
             
-            # Authorization messages
-            r'Access to this page requires authorization.*?directories\.\s*',
-            r'Note\s*Access to this page.*?directories\.\s*',
+            # Authorization messages (spans are bounded so a missing terminator
+            # cannot trigger a scan to the end of the line at every occurrence)
+            r'Access to this page requires authorization.{0,200}?directories\.\s*',
+            r'Note\s*Access to this page.{0,200}?directories\.\s*',
             
             # Code block artifacts
             r"'''\s*Result:\s*",
@@ -52,9 +126,11 @@ class DocumentCleaner:
             # Expand table elements
             r'Expand table\s*',
             
-            # Navigation breadcrumbs (when they appear as separate elements)
-            r'Learn\s*Azure.*?documentation\s*',
-            r'Learn\s*Microsoft.*?documentation\s*',
+            # Navigation breadcrumbs (when they appear as separate elements). A span
+            # stops at the start of the next breadcrumb, so it cannot run across real
+            # text into a later breadcrumb's "documentation"
+            r'Learn\s*Azure(?:(?!Learn\s*(?:Azure|Microsoft)).){0,100}?documentation\s*',
+            r'Learn\s*Microsoft(?:(?!Learn\s*(?:Azure|Microsoft)).){0,100}?documentation\s*',
         ]
         
         # Section headers that indicate content we want to keep
@@ -66,10 +142,24 @@ class DocumentCleaner:
             'Troubleshooting', 'Best practices', 'Security', 'Performance'
         ]
 
+    def __getstate__(self):
+        """Pickle the cleaner's configuration for worker processes, without its connection."""
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
     def connect(self):
         """Connect to the SQLite database."""
         self.conn = sqlite3.connect(self.db_path)
         self.conn.row_factory = sqlite3.Row
+        
+        # Tune for full-table scans and batched writes: WAL journal, memory-mapped
+        # reads and a 256MB page cache
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA mmap_size=30000000000")
+        self.conn.execute("PRAGMA cache_size=-262144")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
 
     def disconnect(self):
         """Disconnect from the database."""
@@ -82,27 +172,23 @@ class DocumentCleaner:
             return ""
         
         # Remove specific patterns
-        for pattern in self.removal_patterns:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.MULTILINE)
+        text = _removal_regex(tuple(self.removal_patterns)).sub('', text)
         
-        # Remove excessive whitespace including tabs and newlines
-        text = re.sub(r'\s+', ' ', text)
+        # Remove excessive whitespace including tabs and newlines, along with
+        # standalone single characters (likely formatting artifacts)
+        text = _WHITESPACE_RE.sub(' ', text)
         
         # Remove repeated punctuation
-        text = re.sub(r'[.,;:!?]{2,}', '.', text)
-        
-        # Remove standalone single characters (likely formatting artifacts)
-        text = re.sub(r'\s+[a-zA-Z]\s+', ' ', text)
+        text = _REPEATED_PUNCT_RE.sub('.', text)
         
         # Remove lines with only special characters
-        text = re.sub(r'^[^\w\s]*$', '', text, flags=re.MULTILINE)
+        text = _SYMBOL_LINE_RE.sub('', text)
         
         # Clean up code blocks and examples
         text = self.clean_code_blocks(text)
         
         # Remove excessive spacing around punctuation
-        text = re.sub(r'\s+([.,;:!?])', r'\1', text)
-        text = re.sub(r'([.,;:!?])\s+', r'\1 ', text)
+        text = _PUNCT_SPACING_RE.sub(_punct_spacing, text)
         
         # Final cleanup
         text = text.strip()
@@ -111,14 +197,15 @@ class DocumentCleaner:
 
     def clean_code_blocks(self, text: str) -> str:
         """Clean up code blocks and examples while preserving their structure."""
-        # Fix common code block issues
-        text = re.sub(r'Python\s+(.+?)\s+Scala', r'Python:\n\1\n\nScala:', text, flags=re.DOTALL)
-        text = re.sub(r'Scala\s+(.+?)(?=\n\n|\Z)', r'Scala:\n\1', text, flags=re.DOTALL)
+        # Fix common code block issues. Both patterns need a "Scala" label, and
+        # without one the lazy scan would run to the end of the text from every "Python"
+        if 'Scala' in text:
+            text = _PYTHON_SCALA_RE.sub(r'Python:\n\1\n\nScala:', text)
+            text = _SCALA_RE.sub(r'Scala:\n\1', text)
         
         # Clean up result blocks
-        text = re.sub(r'Result:\s*\+[-=+]+\+', 'Result:', text)
-        text = re.sub(r'\+[-=+]*\+', '', text)
-        text = re.sub(r'\|[^|]*\|', lambda m: m.group(0).strip(), text)
+        text = _RESULT_TABLE_RE.sub('Result:', text)
+        text = _TABLE_BORDER_RE.sub('', text)
         
         return text
 
@@ -127,66 +214,62 @@ class DocumentCleaner:
         if not text:
             return ""
         
-        # Split into paragraphs
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+        # Split into stripped, non-empty paragraphs without building intermediate lists
+        paragraphs = (p for p in map(str.strip, text.splitlines()) if p)
         
         # Filter out paragraphs that are likely navigation or UI elements
-        content_paragraphs = []
-        skip_next = False
-        
-        for i, paragraph in enumerate(paragraphs):
-            if skip_next:
-                skip_next = False
-                continue
-                
-            # Skip very short paragraphs that are likely UI elements
-            if len(paragraph) < 10:
-                continue
-                
-            # Skip paragraphs that are just numbers or single words
-            if re.match(r'^\d+$', paragraph) or len(paragraph.split()) == 1:
-                continue
-                
-            # Keep paragraphs that contain actual content
-            if (len(paragraph) > 50 or 
-                any(indicator.lower() in paragraph.lower() for indicator in self.content_indicators) or
-                ':' in paragraph or
-                '.' in paragraph):
-                content_paragraphs.append(paragraph)
-        
-        return '\n\n'.join(content_paragraphs)
+        return '\n\n'.join(filter(self.is_content_paragraph, paragraphs))
+
+    def is_content_paragraph(self, paragraph: str) -> bool:
+        """Check if a stripped paragraph holds content rather than navigation or UI text."""
+        # Skip very short paragraphs that are likely UI elements
+        if len(paragraph) < 10:
+            return False
+            
+        # Skip paragraphs that are just numbers or single words
+        if _NUMBER_RE.match(paragraph) or len(paragraph.split()) == 1:
+            return False
+            
+        # Keep paragraphs that contain actual content
+        return bool(len(paragraph) > 50 or 
+                    _indicator_regex(tuple(self.content_indicators)).search(paragraph.lower()) or
+                    ':' in paragraph or
+                    '.' in paragraph)
 
     def is_quality_content(self, content: str) -> bool:
         """Check if the content meets quality standards."""
         if not content or len(content.strip()) < 100:
             return False
         
-        # Check if content has meaningful sentences
-        sentences = re.split(r'[.!?]+', content)
-        meaningful_sentences = [s for s in sentences if len(s.strip()) > 20]
-        
-        if len(meaningful_sentences) < 2:
-            return False
+        # Content should be either long enough or have technical content. Long
+        # content needs no technical check, and both are cheaper than the sentence scan.
+        if len(content) <= 200:
+            has_technical_content = any(marker in content for marker in _CODE_MARKERS)
+            if not has_technical_content:
+                content_lower = content.lower()
+                has_technical_content = any(term in content_lower for term in _TECHNICAL_TERMS)
+            if not has_technical_content:
+                return False
         
-        # Check for code examples or technical content
-        has_technical_content = any([
-            'def ' in content, 'class ' in content, 'import ' in content,
-            'SELECT' in content, 'FROM' in content,
-            'public ' in content, 'private ' in content,
-            'example' in content.lower(), 'code' in content.lower(),
-            'syntax' in content.lower(), 'parameter' in content.lower()
-        ])
-        
-        # Content should be either long enough or have technical content
-        return len(content) > 200 or has_technical_content
+        # Check if content has meaningful sentences
+        return _has_meaningful_sentences(content, 2)
 
-    def clean_documents(self, batch_size: int = 100) -> Dict[str, int]:
-        """Clean all documents in the database."""
+    def clean_documents(self, batch_size: int = 100, workers: Optional[int] = None) -> Dict[str, int]:
+        """Clean all documents in the database.
+        
+        Text cleaning runs in a pool of worker processes (one per CPU by default),
+        while database reads and writes stay in this process.
+        """
         if not self.conn:
             self.connect()
         
+        # Documents are marked 'cleaned' once processed, so re-runs only touch new or re-scraped rows
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_content_type ON documents(content_type)")
+        
         # Get total count
-        total_count = self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        total_count = self.conn.execute(
+            "SELECT COUNT(*) FROM documents WHERE content_type IS NOT 'cleaned'"
+        ).fetchone()[0]
         print(f"📄 Processing {total_count} documents...")
         
         stats = {
@@ -196,61 +279,65 @@ class DocumentCleaner:
             'improved': 0
         }
         
-        # Process in batches
-        offset = 0
-        while offset < total_count:
-            cursor = self.conn.execute(
-                "SELECT id, url, title, content, word_count FROM documents LIMIT ? OFFSET ?",
-                (batch_size, offset)
-            )
-            
-            documents = cursor.fetchall()
-            
-            for doc in documents:
-                stats['processed'] += 1
+        # Workers get a copy of this cleaner, so its patterns, indicators and any
+        # subclass overrides apply in the pool exactly as they would here
+        with Pool(processes=workers, initializer=_init_worker, initargs=(self,)) as pool:
+            # Process in batches, paging on id so each query starts where the last one ended
+            last_id = 0
+            while True:
+                cursor = self.conn.execute(_SQL_SELECT_BATCH, (last_id, batch_size))
                 
-                # Clean the content
-                original_content = doc['content']
-                cleaned_content = self.clean_text(original_content)
-                main_content = self.extract_main_content(cleaned_content)
+                documents = cursor.fetchall()
+                if not documents:
+                    break
+                last_id = documents[-1]['id']
+                updates = []
+                unchanged = []
+                deletes = []
                 
-                # Check content quality
-                if not self.is_quality_content(main_content):
-                    # Remove low-quality documents
-                    self.conn.execute("DELETE FROM documents WHERE id = ?", (doc['id'],))
-                    stats['removed'] += 1
-                    print(f"Removed low-quality document: {doc['title']}")
-                    continue
+                results = pool.imap(_process_document, [doc['content'] for doc in documents], chunksize=16)
                 
-                # Update if content was improved
-                if main_content != original_content:
-                    new_word_count = len(main_content.split())
+                for doc, (main_content, is_quality) in zip(documents, results):
+                    stats['processed'] += 1
+                    original_content = doc['content']
                     
-                    self.conn.execute(
-                        """UPDATE documents 
-                           SET content = ?, word_count = ?, content_type = 'cleaned'
-                           WHERE id = ?""",
-                        (main_content, new_word_count, doc['id'])
-                    )
+                    # Check content quality
+                    if not is_quality:
+                        # Remove low-quality documents
+                        deletes.append((doc['id'],))
+                        stats['removed'] += 1
+                        print(f"Removed low-quality document: {doc['title']}")
+                        continue
                     
-                    stats['improved'] += 1
-                    improvement = len(original_content) - len(main_content)
-                    print(f"Cleaned: {doc['title'][:50]}... (reduced by {improvement} chars)")
-                else:
-                    stats['cleaned'] += 1
-            
-            # Commit batch
-            self.conn.commit()
-            offset += batch_size
-            
-            # Progress update
-            progress = (offset / total_count) * 100
-            print(f"Progress: {progress:.1f}% ({offset}/{total_count})")
+                    # Update if content was improved
+                    if main_content != original_content:
+                        new_word_count = len(main_content.split())
+                        
+                        content_hash = hashlib.md5(main_content.encode('utf-8')).hexdigest()
+                        
+                        updates.append((main_content, new_word_count, content_hash, doc['id']))
+                        
+                        stats['improved'] += 1
+                        improvement = len(original_content) - len(main_content)
+                        print(f"Cleaned: {doc['title'][:50]}... (reduced by {improvement} chars)")
+                    else:
+                        unchanged.append((doc['id'],))
+                        stats['cleaned'] += 1
+                
+                # Write the whole batch in one transaction
+                self.conn.executemany(_SQL_UPDATE, updates)
+                self.conn.executemany(_SQL_MARK_CLEANED, unchanged)
+                self.conn.executemany(_SQL_DELETE, deletes)
+                self.conn.commit()
+                
+                # Progress update
+                progress = (stats['processed'] / total_count) * 100
+                print(f"Progress: {progress:.1f}% ({stats['processed']}/{total_count})")
         
         return stats
 
-    def export_cleaned_data(self, output_file: str = "cleaned_documents.json"):
-        """Export cleaned documents to JSON file."""
+    def export_cleaned_data(self, output_file: str = "cleaned_documents.jsonl"):
+        """Export cleaned documents to a JSON Lines file, one document per line."""
         if not self.conn:
             self.connect()
         
@@ -261,23 +348,24 @@ class DocumentCleaner:
                ORDER BY category, subcategory, title"""
         )
         
-        documents = []
-        for row in cursor:
-            documents.append({
-                'url': row['url'],
-                'title': row['title'],
-                'content': row['content'],
-                'category': row['category'],
-                'subcategory': row['subcategory'],
-                'word_count': row['word_count'],
-                'scraped_at': row['scraped_at']
-            })
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(documents, f, indent=2, ensure_ascii=False)
-        
-        print(f"Exported {len(documents)} cleaned documents to {output_file}")
-        return len(documents)
+        # Rows are written as they are read, so the whole export never has to be held in memory
+        count = 0
+        with open(output_file, 'wb') as f:
+            for row in cursor:
+                document = {
+                    'url': row['url'],
+                    'title': row['title'],
+                    'content': row['content'],
+                    'category': row['category'],
+                    'subcategory': row['subcategory'],
+                    'word_count': row['word_count'],
+                    'scraped_at': row['scraped_at']
+                }
+                f.write(orjson.dumps(document, option=orjson.OPT_APPEND_NEWLINE))
+                count += 1
+        
+        print(f"Exported {count} cleaned documents to {output_file}")
+        return count
 
     def get_cleaning_stats(self) -> Dict[str, Any]:
         """Get statistics about the cleaned data."""
@@ -297,6 +385,20 @@ class DocumentCleaner:
         
         return dict(stats)
 
+# Copy of the calling cleaner owned by each worker process, set by _init_worker
+_worker_cleaner = None
+
+def _init_worker(cleaner: DocumentCleaner):
+    """Keep the cleaner sent by clean_documents for the lifetime of the worker."""
+    global _worker_cleaner
+    _worker_cleaner = cleaner
+
+def _process_document(content: str):
+    """Clean one document in a worker, returning (main_content, is_quality)."""
+    cleaned_content = _worker_cleaner.clean_text(content)
+    main_content = _worker_cleaner.extract_main_content(cleaned_content)
+    return main_content, _worker_cleaner.is_quality_content(main_content)
+
 def main():
     cleaner = DocumentCleaner()
     
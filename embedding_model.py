@@ -0,0 +1,126 @@
+import hashlib
+import importlib.util
+import logging
+import os
+import sqlite3
+from functools import lru_cache
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+# Hashes looked up per query; stays under SQLite's bound-variable limit
+_LOOKUP_BATCH = 500
+
+def _onnx_available() -> bool:
+    """Check that both onnxruntime and optimum's ONNX Runtime integration are installed."""
+    return (onnxruntime is not None
+            and importlib.util.find_spec("optimum") is not None
+            and importlib.util.find_spec("optimum.onnxruntime") is not None)
+
+# Cached so every caller in a process shares one copy of the weights
+@lru_cache(maxsize=None)
+def load_embedder(model_name_or_path: str, max_seq_length: int = 256) -> SentenceTransformer:
+    """Load the sentence transformer on GPU in fp16 when available, else on ONNX Runtime."""
+    if torch.cuda.is_available():
+        # fp16 weights halve memory traffic and run on the GPU's tensor cores
+        model = SentenceTransformer(model_name_or_path, device="cuda")
+        model.half()
+    elif _onnx_available():
+        # Allocate weights outside the memory arena, which would otherwise
+        # over-reserve memory for them on top of the model file
+        session_options = onnxruntime.SessionOptions()
+        session_options.add_session_config_entry("session.use_device_allocator_for_initializers", "1")
+        
+        # A local model directory without an ONNX file is exported on load; that export
+        # repeats on every load unless it is saved back next to the model
+        needs_export = (os.path.isdir(model_name_or_path)
+                        and not os.path.exists(os.path.join(model_name_or_path, "onnx", "model.onnx")))
+        
+        # ONNX Runtime runs the fused graph instead of dispatching eager PyTorch ops
+        model = SentenceTransformer(
+            model_name_or_path,
+            backend="onnx",
+            model_kwargs={"session_options": session_options}
+        )
+        if needs_export:
+            logger.info(f"Saving exported ONNX model to {model_name_or_path}")
+            try:
+                model.save_pretrained(model_name_or_path)
+            except OSError as e:
+                # A read-only model directory only means the export repeats next load
+                logger.warning(f"Could not save exported ONNX model to {model_name_or_path}: {e}")
+    else:
+        logger.warning("ONNX backend unavailable (needs onnxruntime and optimum[onnxruntime]), using PyTorch")
+        model = SentenceTransformer(model_name_or_path)
+    
+    # Truncate long inputs so no batch is padded out past max_seq_length tokens
+    model.max_seq_length = max_seq_length
+    return model
+
+class EmbeddingCache:
+    """On-disk store of raw encode() outputs, keyed by model name and content hash."""
+    
+    def __init__(self, db_path: str = "embedding_cache.db", model_name: str = "all-MiniLM-L6-v2"):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            ) WITHOUT ROWID
+        """)
+        
+    def encode(self, model: SentenceTransformer, texts: list, **encode_kwargs) -> np.ndarray:
+        """Embed texts, running the model only on content that is not cached yet."""
+        hashes = [hashlib.md5(text.encode("utf-8")).hexdigest() for text in texts]
+        
+        cached = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), _LOOKUP_BATCH):
+            batch = unique_hashes[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT content_hash, embedding FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                [self.model_name, *batch]
+            )
+            for content_hash, blob in rows:
+                cached[content_hash] = np.frombuffer(blob, dtype=np.float32)
+        
+        # Encode each missing content once, even if it repeats within texts
+        missing = {}
+        for text, content_hash in zip(texts, hashes):
+            if content_hash not in cached:
+                missing.setdefault(content_hash, text)
+        
+        logger.info(f"Embedding cache: {len(cached)} hits, {len(missing)} misses")
+        
+        if missing:
+            new_embeddings = model.encode(list(missing.values()), convert_to_numpy=True, **encode_kwargs)
+            new_embeddings = np.asarray(new_embeddings, dtype=np.float32)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, embedding) VALUES (?, ?, ?)",
+                [(self.model_name, content_hash, embedding.tobytes())
+                 for content_hash, embedding in zip(missing, new_embeddings)]
+            )
+            self.conn.commit()
+            cached.update(zip(missing, new_embeddings))
+        
+        if not texts:
+            return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([cached[content_hash] for content_hash in hashes])
+        
+    def close(self):
+        """Close the cache database."""
+        self.conn.close()
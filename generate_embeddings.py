@@ -1,7 +1,8 @@
 import sqlite3
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import torch
+from embedding_model import EmbeddingCache, load_embedder
 import os
 from tqdm import tqdm
 import logging
@@ -9,10 +10,16 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HNSW graph parameters: neighbours per node and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
 class Embedder:
-    def __init__(self, db_path: str = "microsoft_docs.db", model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, db_path: str = "microsoft_docs.db", model_name: str = "all-MiniLM-L6-v2",
+                 cache_path: str = "embedding_cache.db"):
         self.db_path = db_path
         self.model_name = model_name
+        self.cache_path = cache_path
         self.model = None
         self.documents = []
         self.embeddings = None
@@ -21,7 +28,7 @@ class Embedder:
     def load_model(self):
         """Load the sentence transformer model."""
         logger.info(f"Loading model: {self.model_name}")
-        self.model = SentenceTransformer(self.model_name)
+        self.model = load_embedder(self.model_name)
         
     def load_documents(self, min_word_count: int = 50):
         """Load documents from database."""
@@ -31,6 +38,11 @@ class Embedder:
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         
+        # Read-only full scan: memory-mapped reads and a 256MB page cache
+        conn.execute("PRAGMA mmap_size=30000000000")
+        conn.execute("PRAGMA cache_size=-262144")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        
         try:
             # First check what columns exist
             cursor = conn.execute("PRAGMA table_info(documents)")
@@ -62,10 +74,9 @@ class Embedder:
                 query += " AND LENGTH(content) >= ?"
                 cursor = conn.execute(query, [min_word_count * 5])
             
-            rows = cursor.fetchall()
-            
+            # Stream rows from the cursor rather than materialising them all first
             self.documents = []
-            for row in rows:
+            for row in cursor:
                 row_dict = dict(row)
                 
                 doc = {
@@ -86,43 +97,67 @@ class Embedder:
         finally:
             conn.close()
     
-    def chunk_document(self, content: str, max_words: int = 500) -> list:
-        """Split long documents into chunks."""
-        words = content.split()
-        if len(words) <= max_words:
+    def chunk_document(self, content: str, offsets: list, max_tokens: int, overlap: int) -> list:
+        """Split a document into overlapping token windows, given its tokenizer offsets."""
+        if len(offsets) <= max_tokens:
             return [content]
         
+        # Slide a max_tokens window with `overlap` shared tokens and cut the
+        # original text at the character span of each window
         chunks = []
-        for i in range(0, len(words), max_words):
-            chunk = " ".join(words[i:i + max_words])
-            chunks.append(chunk)
+        stride = max_tokens - overlap
+        for start in range(0, len(offsets), stride):
+            end = min(start + max_tokens, len(offsets))
+            chunks.append(content[offsets[start][0]:offsets[end - 1][1]])
+            if end == len(offsets):
+                break
         
         return chunks
     
-    def process_documents(self):
-        """Process documents and create chunks."""
+    def process_documents(self, tokenize_batch_size: int = 256):
+        """Process documents and create token-aware, overlapping chunks."""
+        if not self.model:
+            self.load_model()
+        
+        # Size chunks to the model's real input limit, leaving room for [CLS]/[SEP],
+        # with a 10% overlap between neighbouring chunks
+        tokenizer = self.model.tokenizer
+        max_tokens = self.model.max_seq_length - 2
+        overlap = max_tokens // 10
+        
         processed_docs = []
         
-        for doc in self.documents:
-            chunks = self.chunk_document(doc["content"])
+        for start in range(0, len(self.documents), tokenize_batch_size):
+            batch = self.documents[start:start + tokenize_batch_size]
+            encodings = tokenizer(
+                [doc["content"] for doc in batch],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+                verbose=False
+            )
             
-            for i, chunk in enumerate(chunks):
-                chunk_doc = {
-                    "id": f"{doc['id']}_chunk_{i}",
-                    "original_id": doc["id"],
-                    "title": doc["title"],
-                    "content": chunk,
-                    "category": doc["category"],
-                    "url": doc["url"],
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                }
-                processed_docs.append(chunk_doc)
+            for doc, offsets in zip(batch, encodings["offset_mapping"]):
+                chunks = self.chunk_document(doc["content"], offsets, max_tokens, overlap)
+                
+                for i, chunk in enumerate(chunks):
+                    chunk_doc = {
+                        "id": f"{doc['id']}_chunk_{i}",
+                        "original_id": doc["id"],
+                        "title": doc["title"],
+                        "content": chunk,
+                        "category": doc["category"],
+                        "url": doc["url"],
+                        "chunk_index": i,
+                        "total_chunks": len(chunks)
+                    }
+                    processed_docs.append(chunk_doc)
         
         self.documents = processed_docs
         logger.info(f"Created {len(self.documents)} document chunks")
     
-    def generate_embeddings(self, batch_size: int = 32):
+    def generate_embeddings(self, batch_size: int = 128):
         """Generate embeddings for all documents."""
         if not self.model:
             self.load_model()
@@ -135,13 +170,33 @@ class Embedder:
         # Extract text content
         texts = [doc["content"] for doc in self.documents]
         
-        # Generate embeddings
-        self.embeddings = self.model.encode(
-            texts, 
-            batch_size=batch_size,
-            show_progress_bar=True,
-            convert_to_numpy=True
-        )
+        # Only chunks whose content changed since the last build reach the model.
+        # encode() sorts texts by length before batching and restores the input
+        # order afterwards, so batches carry little padding and can be large
+        cache = EmbeddingCache(self.cache_path, self.model_name)
+        
+        # On CPU-only machines PyTorch's BLAS threading stops scaling at a few cores, so
+        # large hosts encode with one worker process per 8 cores instead. Only the torch
+        # backend qualifies: the pool pickles the model into spawned workers, which an
+        # ONNX Runtime session cannot survive, and ORT already threads across every core
+        pool = None
+        pool_size = (os.cpu_count() or 1) // 8
+        if self.model.backend == "torch" and not torch.cuda.is_available() and pool_size > 1:
+            logger.info(f"Encoding with {pool_size} worker processes")
+            pool = self.model.start_multi_process_pool(["cpu"] * pool_size)
+        
+        try:
+            self.embeddings = cache.encode(
+                self.model,
+                texts,
+                batch_size=batch_size,
+                show_progress_bar=True,
+                pool=pool
+            )
+        finally:
+            if pool is not None:
+                self.model.stop_multi_process_pool(pool)
+            cache.close()
         
         logger.info(f"Generated embeddings with shape: {self.embeddings.shape}")
         
@@ -152,12 +207,14 @@ class Embedder:
         
         dimension = self.embeddings.shape[1]
         
-        # Normalising embeddings for cosine similarity
-        normalized_embeddings = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        # Normalise embeddings in place for cosine similarity
+        self.embeddings = np.ascontiguousarray(self.embeddings, dtype='float32')
+        faiss.normalize_L2(self.embeddings)
 
-        # Use simple flat index
-        self.index = faiss.IndexFlatIP(dimension)
-        self.index.add(normalized_embeddings.astype('float32'))
+        # HNSW graph index: sublinear search instead of scanning every vector per query
+        self.index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        self.index.add(self.embeddings)
         
         logger.info(f"Created FAISS index with {self.index.ntotal} vectors")
     
@@ -197,7 +254,7 @@ def main():
     DB_PATH = "microsoft_docs.db"
     MODEL_NAME = "all-MiniLM-L6-v2"
     MIN_WORD_COUNT = 50
-    BATCH_SIZE = 32
+    BATCH_SIZE = 128
     
     embedder = Embedder(DB_PATH, MODEL_NAME)
     
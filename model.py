@@ -1,11 +1,13 @@
+import copy
 import os
 import sqlite3
+import threading
 import faiss
 import numpy as np
 import torch
 from dotenv import load_dotenv
 from huggingface_hub import login
-from sentence_transformers import SentenceTransformer
+from embedding_model import load_embedder
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from category_mappings import get_categories_for_query, CATEGORY_GROUPS
 
@@ -18,29 +20,52 @@ login(hf_token)
 
 print("Loading FAISS index and database...")
 # Load FAISS index and connect to database
-index = faiss.read_index("microsoft_learn_index.faiss")
+# Memory-map the index read-only so the OS pages in only the parts searches touch
+index = faiss.read_index("microsoft_learn_index.faiss", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+# Search depth for HNSW indexes; higher trades latency for recall
+hnsw_ef_search = 64
+if isinstance(index, faiss.IndexHNSW):
+    index.hnsw.efSearch = hnsw_ef_search
+# Contiguous, normalised copy of every indexed vector for exact category scoring; only
+# category search reads it, so it is built on first use by get_index_vectors()
+index_vectors = None
+index_vectors_lock = threading.Lock()
 db_path = "microsoft_docs.db"
 
-# Test database connection
-conn = sqlite3.connect(db_path)
+# One read-only connection shared by every search; Gradio runs handlers on worker
+# threads, so it is opened for cross-thread use and queries are serialised by db_lock
+conn = sqlite3.connect(db_path, check_same_thread=False)
 conn.row_factory = sqlite3.Row
+conn.execute("PRAGMA query_only=1")
+conn.execute("PRAGMA mmap_size=30000000000")
+conn.execute("PRAGMA cache_size=-262144")
+db_lock = threading.Lock()
+
 cursor = conn.execute("SELECT COUNT(*) FROM documents")
 doc_count = cursor.fetchone()[0]
-conn.close()
+
+# Map of each category to the FAISS ids of its indexed documents, so category search
+# needs no per-query SQL; built on first use by get_category_ids()
+category_ids = None
+category_ids_lock = threading.Lock()
 
 print(f"Connected to database with {doc_count} documents")
 
 print("Loading embedding model...")
 # Load embedding model (same as used for generating embeddings)
-embedder = SentenceTransformer("./models/all-MiniLM-L6-v2")
+embedder = load_embedder("./models/all-MiniLM-L6-v2")
 
 print("Loading tokenizer and model...")
+# Compute in bf16 where the GPU supports it (Ampere+): same throughput as fp16
+# with fp32's dynamic range
+compute_dtype = torch.bfloat16 if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else torch.float16
+
 # Configure quantization to improve performance
 quantization_config = BitsAndBytesConfig(
     load_in_4bit=True,
     bnb_4bit_use_double_quant=True,
     bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.float16,
+    bnb_4bit_compute_dtype=compute_dtype,
 )
 
 # Load model
@@ -53,12 +78,31 @@ model = AutoModelForCausalLM.from_pretrained(
     model_name,
     quantization_config=quantization_config,
     device_map="auto",
-    torch_dtype=torch.float16,
+    torch_dtype=compute_dtype,
+    # Fused scaled-dot-product attention kernels from PyTorch itself
+    attn_implementation="sdpa",
     use_auth_token=hf_token
 )
 
 print("Model loaded successfully!")
 
+# Fixed head of every prompt; everything after it depends on the query
+PROMPT_PREFIX = """[INST] You are a Microsoft technology expert specializing in Power Platform, Azure, and Microsoft 365.
+
+    INSTRUCTIONS:
+    • Use provided Microsoft Learn documentation as primary source
+    • Supplement with Microsoft expertise when documentation is limited
+    • Provide clear, well-formatted responses with proper spacing
+
+    CONTEXT:
+"""
+
+print("Precomputing prompt prefix cache...")
+# Prefill the fixed prefix once; each query then only prefills its own context and question
+prefix_ids = tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(model.device)
+with torch.no_grad():
+    prefix_cache = model(input_ids=prefix_ids, use_cache=True).past_key_values
+
 USE_CATEGORY_MAPPING = False
 
 def retrieve_documents(query, top_k=5):
@@ -79,55 +123,84 @@ def retrieve_documents(query, top_k=5):
     print("Using general search")
     return search_general(query, top_k)
 
+def fetch_documents(faiss_ids):
+    """Fetch the documents behind FAISS ids in a single query, keyed by FAISS id."""
+    if not faiss_ids:
+        return {}
+
+    # FAISS positions are rowid - 1
+    placeholders = ','.join('?' * len(faiss_ids))
+    with db_lock:
+        cursor = conn.execute(f"""
+            SELECT rowid-1 as faiss_idx, * FROM documents
+            WHERE rowid IN ({placeholders})
+        """, [faiss_id + 1 for faiss_id in faiss_ids])
+
+        return {doc['faiss_idx']: doc for doc in cursor}
+
+def get_category_ids():
+    """Return the category -> FAISS ids map, scanning the documents table on first use."""
+    global category_ids
+    with category_ids_lock:
+        if category_ids is None:
+            category_rows = {}
+            with db_lock:
+                for faiss_idx, category in conn.execute("SELECT rowid-1, category FROM documents"):
+                    if 0 <= faiss_idx < index.ntotal:
+                        category_rows.setdefault(category, []).append(faiss_idx)
+            category_ids = {category: np.array(ids, dtype='int64') for category, ids in category_rows.items()}
+    return category_ids
+
+def get_index_vectors():
+    """Return the normalised in-memory copy of the index vectors, building it on first use."""
+    global index_vectors
+    with index_vectors_lock:
+        if index_vectors is None:
+            vectors = index.reconstruct_n(0, index.ntotal)
+            faiss.normalize_L2(vectors)
+            index_vectors = vectors
+    return index_vectors
+
 def search_by_category(query, categories, top_k):
     """Search within specific categories."""
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-
     if not categories:
         return []
 
-    category_placeholders = ','.join(['?' for _ in categories])
-    cursor = conn.execute(f"""
-        SELECT rowid-1 as faiss_idx, * FROM documents 
-        WHERE category IN ({category_placeholders})
-    """, categories)
-
-    category_docs = cursor.fetchall()
-    conn.close()
-
-    if not category_docs:
-        print(f"No documents found in categories: {categories}")
+    ids_by_category = get_category_ids()
+    ids = [ids_by_category[category] for category in categories if category in ids_by_category]
+    if not ids:
+        print(f"No indexed documents found in categories: {categories}")
         return []
 
-    print(f"Found {len(category_docs)} documents in target categories")
+    faiss_ids = np.concatenate(ids)
+    print(f"Found {len(faiss_ids)} documents in target categories")
 
     query_embedding = embedder.encode([query])
     query_embedding = query_embedding / np.linalg.norm(query_embedding)
 
-    doc_similarities = []
-    for doc in category_docs:
-        try:
-            faiss_idx = doc['faiss_idx']
-            doc_embedding = index.reconstruct(faiss_idx)
-            doc_embedding = doc_embedding / np.linalg.norm(doc_embedding)
-            
-            similarity = float(np.dot(query_embedding[0], doc_embedding))
-            
-            doc_similarities.append({
-                'similarity_score': similarity,
-                'title': doc['title'],
-                'category': doc['category'],
-                'content': doc['content']
-            })
-        except Exception as e:
-            print(f"Error processing document {doc['title']}: {e}")
-            continue
-    
-    # Sort by similarity and return top results
-    doc_similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return doc_similarities[:top_k]
+    # Score every candidate exactly with a single matrix-vector product over the
+    # normalised vector mirror. Filtered HNSW search only visits the graph neighbourhood
+    # and can miss matches in small categories, while the subset is small enough to scan
+    similarities = get_index_vectors()[faiss_ids] @ query_embedding[0].astype('float32')
+
+    # Partial sort: only the top_k scores need to be ordered
+    k = min(top_k, len(similarities))
+    top_indices = np.argpartition(-similarities, k - 1)[:k]
+    top_indices = top_indices[np.argsort(-similarities[top_indices])]
+
+    docs_by_idx = fetch_documents([int(faiss_ids[i]) for i in top_indices])
+
+    return [
+        {
+            'similarity_score': float(similarities[i]),
+            'title': docs_by_idx[faiss_ids[i]]['title'],
+            'category': docs_by_idx[faiss_ids[i]]['category'],
+            'content': docs_by_idx[faiss_ids[i]]['content']
+        }
+        for i in top_indices
+        if faiss_ids[i] in docs_by_idx
+    ]
 
 def search_general(query, top_k):
     """Original general search method."""
@@ -141,27 +214,22 @@ def search_general(query, top_k):
     print(f"Normalized embedding norm: {np.linalg.norm(query_embedding)}")
     print(f"First 5 values: {query_embedding[0][:5]}")  # Show first 5 value
 
-    # Use the index correctly (it's IndexFlatIP for cosine similarity)
+    # Inner-product search over normalised vectors gives cosine similarity
     similarities, indices = index.search(query_embedding.astype('float32'), top_k)
 
     print(f"Top similarities: {similarities[0]}")
     print(f"Top indices: {indices[0]}")
     
-    # Convert to actual similarity scores (IndexFlatIP returns cosine similarity directly)
+    # Inner-product scores are cosine similarities directly
     print(f"Top similarities: {similarities[0]}")
     print(f"Top indices: {indices[0]}")
 
-    retrieved_docs = []
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    # Fetch every hit in one query instead of one SELECT per result
+    docs_by_idx = fetch_documents([int(idx) for idx in indices[0] if idx != -1])
 
+    retrieved_docs = []
     for similarity, idx in zip(similarities[0], indices[0]):
-        if idx == -1:
-            continue
-
-        idx_int = int(idx)
-        cursor = conn.execute("SELECT * FROM documents WHERE rowid = ?", (idx_int + 1,))
-        doc = cursor.fetchone()
+        doc = docs_by_idx.get(int(idx))
 
         if doc:
             print(f"Retrieved doc {idx}: {doc['title'][:100]}...")
@@ -172,7 +240,6 @@ def search_general(query, top_k):
                 'content': doc['content']
             })
 
-    conn.close()
     return retrieved_docs
 
 def generate_answer(query):
@@ -218,15 +285,7 @@ def generate_answer(query):
     
     context = "\n\n---\n\n".join(context_parts)
     
-    prompt = f"""[INST] You are a Microsoft technology expert specializing in Power Platform, Azure, and Microsoft 365.
-
-    INSTRUCTIONS:
-    • Use provided Microsoft Learn documentation as primary source
-    • Supplement with Microsoft expertise when documentation is limited
-    • Provide clear, well-formatted responses with proper spacing
-
-    CONTEXT:
-    {context}
+    prompt = PROMPT_PREFIX + f"""    {context}
 
     QUESTION:
     {query}
@@ -240,12 +299,19 @@ def generate_answer(query):
         attention_mask = inputs.attention_mask.to(model.device)
         input_length = input_ids.shape[1]
         
+        # Start from a copy of the prefix cache (generate extends it in place), but only
+        # if the prompt tokenized to the same leading ids as the prefix did on its own
+        past_key_values = None
+        if torch.equal(input_ids[0, :prefix_ids.shape[1]], prefix_ids[0]):
+            past_key_values = copy.deepcopy(prefix_cache)
+        
         print("Generating response...")
         
         with torch.no_grad():
             outputs = model.generate(
                 input_ids=input_ids,
                 attention_mask=attention_mask,
+                past_key_values=past_key_values,
                 max_new_tokens=1200,
                 temperature=0.3,
                 do_sample=True,
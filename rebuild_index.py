@@ -1,44 +1,65 @@
 import sqlite3
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+from embedding_model import EmbeddingCache, load_embedder
 
 db_path = "microsoft_docs.db"
 index_path = "microsoft_learn_index.faiss"
+cache_path = "embedding_cache.db"
+model_name = "all-MiniLM-L6-v2"
+
+# HNSW graph parameters: neighbours per node and build-time search depth
+hnsw_m = 32
+hnsw_ef_construction = 200
 
 print("Loading embedding model...")
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+embedder = load_embedder(model_name)
 
 def rebuild_index():
     print("Rebuilding FAISS index...")
     
     # Connect to database
     conn = sqlite3.connect(db_path)
-    cursor = conn.execute("SELECT content FROM documents")
-    
-    all_docs = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    conn.execute("PRAGMA mmap_size=30000000000")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
     
-    print(f"Encoding {len(all_docs)} documents...")
+    # Count and scan inside one read transaction so both see the same snapshot,
+    # even while the scraper or cleaner writes to the database in WAL mode
+    conn.execute("BEGIN")
+    total = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    print(f"Encoding {total} documents...")
     
-    # Re-encode all documents
-    embeddings = []
+    # Stream documents from the cursor one batch at a time; only content that
+    # changed since the last rebuild is re-encoded
+    cache = EmbeddingCache(cache_path, model_name)
+    cursor = conn.execute("SELECT content FROM documents")
+    embeddings = np.empty((total, embedder.get_sentence_embedding_dimension()), dtype='float32')
     batch_size = 1000
+    processed = 0
     
-    for i in range(0, len(all_docs), batch_size):
-        batch = all_docs[i:i+batch_size]
-        batch_embeddings = embedder.encode(batch)
+    while True:
+        batch = [row[0] for row in cursor.fetchmany(batch_size)]
+        if not batch:
+            break
+        batch_embeddings = cache.encode(embedder, batch)
         
-        # Normalize each embedding
-        for embedding in batch_embeddings:
-            normalized = embedding / np.linalg.norm(embedding)
-            embeddings.append(normalized)
+        # Write the batch straight into the preallocated matrix and normalize it in place
+        batch_slice = embeddings[processed:processed + len(batch)]
+        batch_slice[:] = batch_embeddings
+        faiss.normalize_L2(batch_slice)
         
-        print(f"Processed {min(i+batch_size, len(all_docs))}/{len(all_docs)}")
+        processed += len(batch)
+        print(f"Processed {processed}/{total}")
+    
+    conn.commit()
+    cache.close()
+    conn.close()
     
-    embeddings_array = np.array(embeddings).astype('float32')
+    embeddings_array = embeddings[:processed]
     
-    new_index = faiss.IndexFlatIP(embeddings_array.shape[1])
+    new_index = faiss.IndexHNSWFlat(embeddings_array.shape[1], hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    new_index.hnsw.efConstruction = hnsw_ef_construction
     new_index.add(embeddings_array)
     
     faiss.write_index(new_index, index_path)